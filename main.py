@@ -1,88 +1,522 @@
+import functools
+import hashlib
 import os
+import pickle
 import subprocess
+import tempfile
 from pathlib import Path
 from tkinter import Tk, filedialog, ttk, Button, Label, StringVar, BooleanVar, Checkbutton
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from pygments import highlight
-from pygments.lexers import guess_lexer_for_filename
-from pygments.util import ClassNotFound
-from bs4 import BeautifulSoup
-
-# Register Calibri font for PDF (fallback if missing)
-try:
-    pdfmetrics.registerFont(TTFont("Calibri", "calibri.ttf"))
-except:
-    print("Calibri font file not found. Using default font.")
 
 EXTENSIONS = {".py", ".c", ".h", ".yaml", ".yml", ".cpp", ".java", ".txt", ".json"}
+_EXT_TUPLE = tuple(sorted(EXTENSIONS))
 
-styles = getSampleStyleSheet()
-styles["Heading3"].fontName = "Calibri"
-styles["Heading3"].fontSize = 12
+# Pygments lexer alias for each supported extension
+LEXER_ALIASES = {
+    ".py": "python",
+    ".c": "c",
+    ".h": "c",
+    ".cpp": "cpp",
+    ".java": "java",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".json": "json",
+    ".txt": "text",
+}
 
-code_style_pdf = ParagraphStyle(
-    "Code",
-    fontName="Calibri",
-    fontSize=8,
-    leading=10,
-    spaceAfter=6,
-)
+# Highlighted lines are cached here, keyed by a hash of extension + content
+# (plus the Pygments version and style, see _load_backends).
+# Bump CACHE_VERSION whenever the output of ReportLabFormatter.token_lines changes.
+CACHE_DIR = Path.home() / ".codeFilesToFormat" / "cache"
+CACHE_VERSION = b"4"
 
 
-# ---------- Code Formatting ----------
-def format_code(file_path):
-    ext = Path(file_path).suffix.lower()
+# ---------- Backends ----------
+# reportlab and pygments take a noticeable time to import and are only needed
+# once Convert is pressed, so they are loaded on first use rather than at startup.
+# Every function below that touches these globals calls _load_backends() first;
+# after the first call that is just an lru_cache hit.
+@functools.lru_cache(maxsize=None)
+def _load_backends():
+    global BaseDocTemplate, Frame, PageTemplate, Paragraph, Spacer, PageBreak, XPreformatted
+    global A4, inch, Canvas, HexColor, black, get_lexer_by_name, ClassNotFound
+    global pdfmetrics, styles, code_style_pdf, _FORMATTER, _SPACER, _PAGE_BREAK, _TEXT_WIDTH, _CODE_FRAG
+    global _CACHE_SALT
+    from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Paragraph, Spacer, PageBreak, XPreformatted
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.lib.colors import HexColor, black
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from pygments.formatter import Formatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+    import pygments
+    import pygments.plugin
+
+    # Pygments rescans every installed entry point on each plugin lookup;
+    # the set cannot change while we run, so scan once per group.
+    _iter_entry_points = pygments.plugin.iter_entry_points
+    pygments.plugin.iter_entry_points = functools.lru_cache(maxsize=None)(
+        lambda group_name: tuple(_iter_entry_points(group_name))
+    )
+
+    # Register Calibri font for PDF (fallback if missing)
     try:
-        if ext == ".py":
-            subprocess.run(["black", "--quiet", file_path], check=True)
-        elif ext in {".c", ".h", ".cpp"}:
-            subprocess.run(["clang-format", "-i", file_path], check=True)
-        elif ext in {".yaml", ".yml", ".json"}:
-            subprocess.run(["prettier", "--write", file_path], check=True)
-    except FileNotFoundError:
-        print(f"Formatter not installed for {file_path}. Skipping.")
-    except Exception as e:
-        print(f"Could not format {file_path}: {e}")
+        pdfmetrics.registerFont(TTFont("Calibri", "calibri.ttf"))
+    except:
+        print("Calibri font file not found. Using default font.")
+
+    styles = getSampleStyleSheet()
+    styles["Heading3"].fontName = "Calibri"
+    styles["Heading3"].fontSize = 12
+
+    code_style_pdf = ParagraphStyle(
+        "Code",
+        fontName="Calibri",
+        fontSize=8,
+        leading=10,
+        spaceAfter=0,
+    )
+
+    # Usable line width inside the A4 frame (1 inch margins, 6pt frame padding)
+    _TEXT_WIDTH = A4[0] - 2 * inch - 12
+
+    # Fragment with the code style already applied; cloned per run so code
+    # blocks are built without going through ReportLab's markup parser.
+    _CODE_FRAG = XPreformatted("x", code_style_pdf).frags[0]
+
+    # Stateless flowables, shared by every file instead of rebuilt per file
+    _SPACER = Spacer(1, 0.2 * inch)
+    _PAGE_BREAK = PageBreak()
+
+    class ReportLabFormatter(Formatter):
+        """Split tokens into source lines of (color, text) runs for the PDF renderers."""
+
+        def __init__(self, **options):
+            super().__init__(**options)
+            self.colors = {}
+            for ttype, style in self.style:
+                if style["color"]:
+                    self.colors[ttype] = style["color"]
+
+        def token_lines(self, tokensource):
+            # Runs once per token; keep lookups in locals
+            get_color = self.colors.get
+            line = []
+            lines = [line]
+            for ttype, value in tokensource:
+                color = get_color(ttype)
+                while color is None and ttype.parent is not None:
+                    ttype = ttype.parent
+                    color = get_color(ttype)
+                parts = value.split("\n")
+                for i, part in enumerate(parts):
+                    if i:
+                        line = []
+                        lines.append(line)
+                    if part:
+                        line.append((color, part))
+            # Lexers always end the stream with a newline; drop the empty tail
+            if len(lines) > 1 and not lines[-1]:
+                lines.pop()
+            return lines
+
+    _FORMATTER = ReportLabFormatter()
+
+    # A Pygments upgrade or a different style changes tokens and colours, so
+    # both are part of every cache key.
+    style_name = getattr(_FORMATTER.style, "name", _FORMATTER.style.__name__)
+    _CACHE_SALT = b"\0".join((CACHE_VERSION, pygments.__version__.encode(), style_name.encode()))
+
+
+# ---------- Code Formatting ----------
+FORMATTERS = [
+    ({".py"}, ["black", "--quiet"]),
+    ({".c", ".h", ".cpp"}, ["clang-format", "-i"]),
+    ({".yaml", ".yml", ".json"}, ["prettier", "--write"]),
+]
+
+# Files per formatter invocation; keeps command lines well under ARG_MAX
+FORMAT_BATCH_SIZE = 128
+
+
+def format_files(file_list):
+    for exts, command in FORMATTERS:
+        batch = [f for f in file_list if Path(f).suffix.lower() in exts]
+        for i in range(0, len(batch), FORMAT_BATCH_SIZE):
+            chunk = batch[i:i + FORMAT_BATCH_SIZE]
+            try:
+                subprocess.run(command + chunk, check=True)
+            except FileNotFoundError:
+                print(f"Formatter {command[0]} not installed. Skipping {len(batch)} files.")
+                break
+            except Exception as e:
+                print(f"Could not format {len(chunk)} files with {command[0]}: {e}")
 
 
 # ---------- File Reading ----------
+def iter_code_files(folder):
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError as e:
+            # os.walk skipped unreadable folders silently; keep going, but say so
+            print(f"Skipping {current} (read error: {e})")
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(_EXT_TUPLE):
+                    # Like Path.suffix, a lone leading dot (".py") is not an extension
+                    if entry.name.rfind(".") > 0:
+                        yield entry.path
+
+
 def get_code(file_path):
     try:
-        code = Path(file_path).read_text(encoding="utf-8")
+        data = Path(file_path).read_bytes()
     except Exception as e:
         print(f"Skipping {file_path} (read error: {e})")
         return None
+    code = data.decode("utf-8", "replace")
+    # Normalise line endings ourselves instead of paying for universal-newline mode
+    if "\r" in code:
+        code = code.replace("\r\n", "\n").replace("\r", "\n")
     return code
 
 
+# Reads are blocking syscalls, so overlap them on a thread pool; the
+# semaphore caps how many files are open at once.
+READ_WORKERS = 32
+MAX_OPEN_FILES = 256
+
+
+async def get_code_async(file_path, executor, semaphore):
+    import asyncio
+
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, get_code, file_path)
+
+
+async def _read_all(file_list):
+    import asyncio
+    import concurrent.futures
+
+    semaphore = asyncio.BoundedSemaphore(MAX_OPEN_FILES)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        codes = await asyncio.gather(*(get_code_async(f, executor, semaphore) for f in file_list))
+    return dict(zip(file_list, codes))
+
+
+def read_files(file_list):
+    """Read every file up front and return a {path: code} dict (code is None on error)."""
+    if len(file_list) <= 1:
+        return {f: get_code(f) for f in file_list}
+    # Imported here, like the reportlab/pygments backends, to keep GUI startup fast
+    import asyncio
+
+    return asyncio.run(_read_all(file_list))
+
+
+# ---------- Highlighting ----------
+TAB_SIZE = 4
+
+_ESCAPE_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+def escape_markup(text):
+    return text.translate(_ESCAPE_TABLE)
+
+
+@functools.lru_cache(maxsize=None)
+def to_color(hex_color):
+    _load_backends()
+    return HexColor("#" + hex_color) if hex_color else black
+
+
+def runs_frags(lines):
+    """Build XPreformatted fragments for lines of (color, text) runs."""
+    _load_backends()
+    clone = _CODE_FRAG.clone
+    frags = []
+    append = frags.append
+    for i, line in enumerate(lines):
+        if i:
+            append(clone(text="\n"))
+        for color, text in line:
+            append(clone(text=text, textColor=to_color(color)))
+        if not line:
+            # A fragment-less line at either end of a block would be dropped
+            append(clone(text=" "))
+    return frags
+
+
+def wrap_runs(runs, max_width, font, size):
+    """Split one line of (color, text) runs into lines no wider than max_width."""
+    _load_backends()
+    string_width = pdfmetrics.stringWidth
+    if string_width("".join(text for _, text in runs), font, size) <= max_width:
+        return [runs]
+    lines = []
+    line = []
+    used = 0
+    for color, text in runs:
+        width = string_width(text, font, size)
+        if used + width <= max_width:
+            line.append((color, text))
+            used += width
+            continue
+        start = 0
+        for i, ch in enumerate(text):
+            ch_width = string_width(ch, font, size)
+            if used + ch_width > max_width and (line or i > start):
+                if i > start:
+                    line.append((color, text[start:i]))
+                lines.append(line)
+                line = []
+                used = 0
+                start = i
+            used += ch_width
+        if start < len(text):
+            line.append((color, text[start:]))
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _build_lexer(alias):
+    _load_backends()
+    # The extension whitelist fully determines the lexer, so there is no need
+    # to let Pygments guess from the filename and content. Tabs are expanded
+    # because the PDF font has no glyph for them.
+    try:
+        return get_lexer_by_name(alias, tabsize=TAB_SIZE)
+    except ClassNotFound:
+        return get_lexer_by_name("text", tabsize=TAB_SIZE)
+
+
+# Most folders are dominated by one language, so a single remembered
+# (alias, lexer) pair hits almost every time without a dict lookup. Keyed on
+# the alias so interleaved .c/.h or .yaml/.yml files share the slot.
+_cache_alias = None
+_cache_lexer = None
+
+
+def get_lexer(ext):
+    global _cache_alias, _cache_lexer
+    alias = LEXER_ALIASES.get(ext, "text")
+    if alias == _cache_alias:
+        return _cache_lexer
+    _cache_lexer = _build_lexer(alias)
+    _cache_alias = alias
+    return _cache_lexer
+
+
+def _cache_path(code, ext):
+    _load_backends()
+    digest = hashlib.blake2b(b"\0".join((_CACHE_SALT, ext.encode(), code.encode())), digest_size=16)
+    return CACHE_DIR / f"{digest.hexdigest()}.pkl"
+
+
+def _load_cached(cache_file):
+    try:
+        with open(cache_file, "rb") as fh:
+            return pickle.load(fh)
+    except Exception:
+        return None
+
+
+def _highlight_and_store(code, ext, cache_file):
+    _load_backends()
+    lines = _FORMATTER.token_lines(get_lexer(ext).get_tokens(code))
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(lines, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic so concurrent workers never see a half-written entry
+        os.replace(tmp_path, cache_file)
+    except Exception as e:
+        print(f"Could not write highlight cache: {e}")
+        # The cache is never evicted, so don't leave failed writes behind
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    return lines
+
+
+def _plain_lines(code):
+    # Plain text has no colours to render, so skip the lexer and the cache
+    lines = code.split("\n")
+    if len(lines) > 1 and not lines[-1]:
+        lines.pop()
+    return [[(None, line.expandtabs(TAB_SIZE))] if line else [] for line in lines]
+
+
+def highlight_lines(code, ext):
+    if LEXER_ALIASES.get(ext, "text") == "text":
+        return _plain_lines(code)
+    cache_file = _cache_path(code, ext)
+    lines = _load_cached(cache_file)
+    if lines is None:
+        lines = _highlight_and_store(code, ext, cache_file)
+    return lines
+
+
+def process_file(job):
+    # Highlights a cache miss. Returns plain (color, text) runs rather than
+    # flowables: they pickle cleanly, so this can run in worker processes and
+    # the story is built afterwards.
+    file_path, code, cache_file = job
+    return _highlight_and_store(code, Path(file_path).suffix.lower(), cache_file)
+
+
+# Worker processes cost tens (fork) to hundreds (spawn) of milliseconds to
+# start, so only fan out when there is enough uncached code to lex.
+PARALLEL_MIN_FILES = 4
+PARALLEL_MIN_BYTES = 512 * 1024
+
+
+def highlight_files(jobs):
+    """Highlight (path, code) jobs, serving cache hits here and lexing misses in parallel."""
+    results = []
+    misses = []
+    for file_path, code in jobs:
+        ext = Path(file_path).suffix.lower()
+        if LEXER_ALIASES.get(ext, "text") == "text":
+            results.append(_plain_lines(code))
+            continue
+        cache_file = _cache_path(code, ext)
+        lines = _load_cached(cache_file)
+        if lines is None:
+            misses.append((len(results), (file_path, code, cache_file)))
+        results.append(lines)
+    if not misses:
+        return results
+
+    miss_jobs = [job for _, job in misses]
+    if len(miss_jobs) < PARALLEL_MIN_FILES or sum(len(job[1]) for job in miss_jobs) < PARALLEL_MIN_BYTES:
+        highlighted = [process_file(job) for job in miss_jobs]
+    else:
+        # A fixed chunksize would hand a small miss set to a single worker
+        import concurrent.futures
+
+        chunksize = max(1, len(miss_jobs) // (4 * (os.cpu_count() or 1)))
+        with concurrent.futures.ProcessPoolExecutor(initializer=_init_worker) as ex:
+            highlighted = list(ex.map(process_file, miss_jobs, chunksize=chunksize))
+    for (i, _), lines in zip(misses, highlighted):
+        results[i] = lines
+    return results
+
+
 # ---------- Export Functions ----------
+# Source lines per XPreformatted flowable in the platypus path
+CODE_BLOCK_LINES = 50
+
+
+def _make_doc(output_file):
+    _load_backends()
+    # The single-frame A4 layout SimpleDocTemplate builds, with one page
+    # template instead of its separate First/Later pair.
+    margin = inch
+    width, height = A4
+    frame = Frame(margin, margin, width - 2 * margin, height - 2 * margin, id="normal")
+    return BaseDocTemplate(output_file, pagesize=A4, pageTemplates=[PageTemplate(id="First", frames=frame, pagesize=A4)])
+
+
 def pdf_from_files(file_list, output_file):
-    doc = SimpleDocTemplate(output_file, pagesize=A4)
+    _load_backends()
+    doc = _make_doc(output_file)
     story = []
-    for f in file_list:
-        code = get_code(f)
-        if code is None:
-            continue
-        story.append(Paragraph(f"<b>{f}</b>", styles["Heading3"]))
-        story.append(Spacer(1, 0.2 * inch))
-        for line in code.split("\n"):
-            story.append(Paragraph(line.replace(" ", "&nbsp;"), code_style_pdf))
-        story.append(PageBreak())
+    codes = read_files(file_list)
+    jobs = [(f, codes[f]) for f in file_list if codes[f] is not None]
+    # Lexing fans out to worker processes; building the story and laying it
+    # out stays here, since reportlab is not thread-safe.
+    highlighted = highlight_files(jobs)
+    append = story.append
+    P = Paragraph
+    X = XPreformatted
+    h3 = styles["Heading3"]
+    cs = code_style_pdf
+    font, size, max_width = cs.fontName, cs.fontSize, _TEXT_WIDTH
+    spacer = _SPACER
+    page_break = _PAGE_BREAK
+    for (f, _), lines in zip(jobs, highlighted):
+        append(P("<b>" + escape_markup(f) + "</b>", h3))
+        append(spacer)
+        # XPreformatted keeps whitespace but never wraps, so long lines are
+        # split to the frame width first. Blocks of CODE_BLOCK_LINES keep the
+        # cost of splitting a block across pages bounded.
+        wrapped = [part for line in lines for part in wrap_runs(line, max_width, font, size)]
+        for i in range(0, len(wrapped), CODE_BLOCK_LINES):
+            append(X("", cs, frags=runs_frags(wrapped[i:i + CODE_BLOCK_LINES])))
+        append(page_break)
     doc.build(story)
 
 
+def canvas_pdf_from_file(file_path, output_file):
+    """Draw a single file straight onto a canvas, skipping platypus layout."""
+    _load_backends()
+    code = get_code(file_path)
+    if code is None:
+        return
+    lines = highlight_lines(code, Path(file_path).suffix.lower())
+    heading = styles["Heading3"]
+    font, size, leading = code_style_pdf.fontName, code_style_pdf.fontSize, code_style_pdf.leading
+    width, height = A4
+    max_width = width - 2 * inch
+    top, bottom = height - inch, inch
+
+    c = Canvas(output_file, pagesize=A4)
+    y = top - heading.fontSize
+    c.setFont(heading.fontName, heading.fontSize)
+    # Paths rarely contain spaces to break at, so wrap them per character
+    for runs in wrap_runs([(None, file_path)], max_width, heading.fontName, heading.fontSize):
+        c.drawString(inch, y, runs[0][1])
+        y -= heading.leading
+    text = c.beginText(inch, y - 0.2 * inch)
+    text.setFont(font, size, leading)
+
+    current = None
+    for line in lines:
+        # Wrap before the page-break check so continuation lines paginate too
+        for runs in wrap_runs(line, max_width, font, size):
+            if text.getY() < bottom:
+                c.drawText(text)
+                c.showPage()
+                text = c.beginText(inch, top - leading)
+                text.setFont(font, size, leading)
+                current = None
+            for hex_color, part in runs:
+                color = to_color(hex_color)
+                if color is not current:
+                    text.setFillColor(color)
+                    current = color
+                text.textOut(part)
+            text.textLine()
+    c.drawText(text)
+    c.showPage()
+    c.save()
+
+
 def txt_from_files(file_list, output_file):
-    with open(output_file, "w", encoding="utf-8") as out:
-        for f in file_list:
-            code = get_code(f)
-            if code:
-                out.write(f"## {f} ##\n")
-                out.write(code + "\n\n")
+    codes = read_files(file_list)
+    chunks = []
+    for f in file_list:
+        code = codes[f]
+        if code:
+            chunks.extend((f"## {f} ##\n", code, "\n\n"))
+    with open(output_file, "w", encoding="utf-8", buffering=1 << 20) as out:
+        out.writelines(chunks)
 
 
 # ---------- Main Process ----------
@@ -90,22 +524,47 @@ def process_folder(folder, mode, fmt, beautify):
     output_dir = Path(__file__).parent / f"{fmt.lower()}_output"
     output_dir.mkdir(exist_ok=True)
 
-    file_list = []
-    for root, _, files in os.walk(folder):
-        for file in sorted(files):
-            if Path(file).suffix.lower() in EXTENSIONS:
-                full_path = os.path.join(root, file)
-                if beautify:
-                    format_code(full_path)
-                file_list.append(full_path)
+    file_list = list(iter_code_files(folder))
+    # One case-insensitive sort for the whole run so order is the same on every platform
+    file_list.sort(key=str.lower)
+
+    if beautify:
+        format_files(file_list)
 
     if mode == "Single":
         out_file = output_dir / f"all_code.{fmt.lower()}"
         export_single(file_list, out_file, fmt)
     else:
+        # Mirror the source tree so foo.c and foo.h (or two a.py files in
+        # different folders) never map to the same output path.
+        jobs = []
         for f in file_list:
-            out_file = output_dir / f"{Path(f).stem}.{fmt.lower()}"
-            export_single([f], out_file, fmt)
+            out_file = output_dir / f"{os.path.relpath(f, folder)}.{fmt.lower()}"
+            out_file.parent.mkdir(parents=True, exist_ok=True)
+            jobs.append((f, out_file, fmt))
+        if fmt == "PDF" and len(jobs) >= PARALLEL_MIN_FILES and _total_size(file_list) >= PARALLEL_MIN_BYTES:
+            # Each file becomes an independent document. ReportLab is not
+            # thread-safe, so fan the work out to processes instead of threads.
+            import concurrent.futures
+
+            chunksize = max(1, len(jobs) // (4 * (os.cpu_count() or 1)))
+            with concurrent.futures.ProcessPoolExecutor(initializer=_init_worker) as ex:
+                list(ex.map(_export_job, jobs, chunksize=chunksize))
+        else:
+            # TXT output is plain I/O, and small PDF runs finish before a pool
+            # (especially under spawn) would even start
+            for job in jobs:
+                _export_job(job)
+
+
+def _total_size(file_list):
+    total = 0
+    for f in file_list:
+        try:
+            total += os.path.getsize(f)
+        except OSError:
+            pass
+    return total
 
 
 def export_single(files, out_file, fmt):
@@ -115,6 +574,23 @@ def export_single(files, out_file, fmt):
         txt_from_files(files, str(out_file))
 
 
+def _init_worker():
+    _load_backends()
+    # Only pre-imports the lexer modules so no job pays for that; the
+    # single-slot cache itself keeps just whichever lexer came last.
+    for ext in EXTENSIONS:
+        get_lexer(ext)
+
+
+def _export_job(job):
+    file_path, out_file, fmt = job
+    if fmt == "PDF":
+        # One file per document needs no flowable layout; draw it directly
+        canvas_pdf_from_file(file_path, str(out_file))
+    else:
+        export_single([file_path], out_file, fmt)
+
+
 # ---------- GUI ----------
 def run_gui():
     root = Tk()